@@ -0,0 +1,39 @@
+"""
+gunicorn.conf.py
+─────────────────────────────────────────────────────────────────────────────
+SAP BTP AI Core – PR Anomaly Detection  |  Gunicorn configuration
+
+Isolation Forest scoring is CPU-bound, so throughput comes from multiple
+sync worker processes rather than threads or async workers.  The app is
+preloaded in the master: the model is loaded once by create_app() and the
+forked workers share its memory pages copy-on-write.  Freezing the GC before
+each fork keeps those pages shared (see pre_fork below).
+
+Environment variables
+─────────────────────
+    PORT             – HTTP port                 (default: 8080)
+    WEB_CONCURRENCY  – number of worker processes (default: 2 × CPU cores;
+                       Dockerfile.serve pins 2, as containers see the
+                       node's cores rather than their CPU limit)
+─────────────────────────────────────────────────────────────────────────────
+"""
+
+import gc
+import os
+
+bind         = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers      = int(os.getenv("WEB_CONCURRENCY", max(2, 2 * (os.cpu_count() or 1))))
+worker_class = "sync"
+preload_app  = True
+timeout      = 120
+
+# Log to stdout/stderr so SAP AI Core picks the logs up
+accesslog = "-"
+errorlog  = "-"
+
+
+def pre_fork(server, worker):
+    # Move everything loaded so far (model artefact, compiled forest) into the
+    # permanent GC generation.  Collections in the workers then never write to
+    # those objects' GC headers, so their pages are not copied per worker.
+    gc.freeze()
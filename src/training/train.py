@@ -30,8 +30,10 @@ from typing import Any
 import joblib
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import csv as pa_csv
 from sklearn.ensemble import IsolationForest
-from sklearn.preprocessing import LabelEncoder
 
 # ── Logging ───────────────────────────────────────────────────────────────────
 logging.basicConfig(
@@ -82,6 +84,14 @@ REQUIRED_COLS = [
     "header_text",         # TXTHD – header text (may be blank)
 ]
 
+# Explicit CSV column types: codes and identifiers stay strings (no "001" → 1
+# or "10001010" → "10001010.0" mangling), numerics are read at the float32
+# precision the model is fitted at.
+CSV_COLUMN_TYPES = {col: pa.string() for col in REQUIRED_COLS} | {
+    "quantity":  pa.float32(),
+    "net_price": pa.float32(),
+}
+
 # Columns used as model features (subset of REQUIRED_COLS, all numeric/encoded)
 CATEGORICAL_FEATURES = [
     "pr_type", "company_code", "plant", "purchasing_group",
@@ -99,39 +109,73 @@ NUMERIC_FEATURES = [
 
 # ── Feature engineering ───────────────────────────────────────────────────────
 
-def engineer_features(df: pd.DataFrame) -> tuple[pd.DataFrame, dict[str, LabelEncoder]]:
+def _date_parts(value: str | None) -> tuple[int, int]:
     """
-    Derive numeric/encoded features from raw PR data.
-    Returns the feature matrix and a dict of fitted LabelEncoders
-    (needed at serving time to encode incoming requests consistently).
+    (day_of_week, month) of an ISO-8601 date string, or (-1, -1) if it cannot
+    be parsed – mirrors the serving API so both sides encode dates alike.
     """
-    df = df.copy()
-
-    # Date-derived features
-    df["pr_date"] = pd.to_datetime(df["pr_date"], errors="coerce")
-    df["day_of_week"] = df["pr_date"].dt.dayofweek.fillna(-1).astype(int)
-    df["month"]       = df["pr_date"].dt.month.fillna(-1).astype(int)
+    try:
+        pr_date = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return -1, -1
+    return pr_date.weekday(), pr_date.month
 
-    # Text-length feature
-    df["text_length"] = df["short_text"].fillna("").str.len()
-
-    # Encode categoricals
-    encoders: dict[str, LabelEncoder] = {}
-    for col in CATEGORICAL_FEATURES:
-        le = LabelEncoder()
-        df[col] = df[col].fillna("__UNKNOWN__").astype(str)
-        df[col + "_enc"] = le.fit_transform(df[col])
-        encoders[col] = le
 
+def engineer_features(df: pd.DataFrame) -> tuple[np.ndarray, list[str], dict[str, np.ndarray]]:
+    """
+    Derive numeric/encoded features from raw PR data.
+    Returns a contiguous float32 feature matrix, its column names, and a dict
+    of sorted class arrays per categorical column (needed at serving time to
+    encode incoming requests consistently).
+    """
     feature_cols = [c + "_enc" for c in CATEGORICAL_FEATURES] + NUMERIC_FEATURES
-    return df[feature_cols], encoders
+    X = np.empty((len(df), len(feature_cols)), dtype=np.float32)
+
+    # Encode categoricals – code = position in the sorted class array.
+    # Hashing, sorting and lookup all run in Arrow compute kernels on the
+    # column buffers; only the (small) class arrays become Python strings.
+    encoders: dict[str, np.ndarray] = {}
+    for k, col in enumerate(CATEGORICAL_FEATURES):
+        values  = pa.array(df[col].astype("string[pyarrow]")).fill_null("__UNKNOWN__")
+        classes = pc.unique(values)
+        classes = classes.take(pc.sort_indices(classes))
+        X[:, k] = pc.index_in(values, value_set=classes).to_numpy()
+        encoders[col] = np.array(classes.to_pylist(), dtype=object)
+
+    # Date-derived features – parsed once per distinct pr_date, with the same
+    # ISO-8601 rule the serving API uses
+    dates      = pa.array(df["pr_date"].astype("string[pyarrow]"))
+    uniq_dates = pc.unique(dates)
+    date_parts = np.array([_date_parts(d) for d in uniq_dates.to_pylist()], dtype=np.float32)
+    date_parts = date_parts.reshape(-1, 2)[pc.index_in(dates, value_set=uniq_dates).to_numpy()]
+
+    numerics = {
+        "quantity":    df["quantity"],
+        "net_price":   df["net_price"],
+        "day_of_week": pd.Series(date_parts[:, 0]),
+        "month":       pd.Series(date_parts[:, 1]),
+        # Arrow-backed strings: .str.len() is one C pass over the offsets buffer
+        "text_length": df["short_text"].astype("string[pyarrow]").str.len().fillna(0),
+    }
+    for k, col in enumerate(NUMERIC_FEATURES, start=len(CATEGORICAL_FEATURES)):
+        X[:, k] = numerics[col].to_numpy(dtype=np.float32, na_value=np.nan)
+
+    return X, feature_cols, encoders
 
 
 # ── Training ──────────────────────────────────────────────────────────────────
 
 def load_data(path: str) -> pd.DataFrame:
     log.info("Loading data from %s", path)
-    df = pd.read_csv(path, low_memory=False)
+    # Multithreaded Arrow reader; strings stay in Arrow buffers, not Python objects
+    table = pa_csv.read_csv(
+        path,
+        convert_options=pa_csv.ConvertOptions(
+            column_types=CSV_COLUMN_TYPES,
+            strings_can_be_null=True,   # empty cells → null, as pandas would read them
+        ),
+    )
+    df = table.to_pandas(types_mapper=pd.ArrowDtype)
     log.info("Loaded %d rows × %d columns", len(df), len(df.columns))
 
     missing = [c for c in REQUIRED_COLS if c not in df.columns]
@@ -141,15 +185,14 @@ def load_data(path: str) -> pd.DataFrame:
     return df
 
 
-def train(df: pd.DataFrame) -> tuple[dict[str, Any], dict[str, LabelEncoder]]:
+def train(df: pd.DataFrame) -> tuple[dict[str, Any], dict[str, np.ndarray]]:
     """
     Engineers features and fits an Isolation Forest.
     Returns (artefact_dict, encoders) – artefact_dict is what gets serialised.
     """
     log.info("Engineering features …")
-    X, encoders = engineer_features(df)
+    X, feature_cols, encoders = engineer_features(df)
 
-    feature_cols = list(X.columns)
     log.info("Training on %d samples, %d features", len(X), len(feature_cols))
 
     log.info(
@@ -198,7 +241,8 @@ def save_artefacts(artefact: dict[str, Any]) -> None:
     meta_path.parent.mkdir(parents=True, exist_ok=True)
 
     log.info("Saving model artefact → %s", model_path)
-    joblib.dump(artefact, model_path, compress=3)
+    # LZ4 decompresses far faster than zlib, which shortens serving cold starts
+    joblib.dump(artefact, model_path, compress=("lz4", 3))
 
     metadata = {
         "model_type":     "IsolationForest",